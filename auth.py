@@ -0,0 +1,252 @@
+"""Login accounts with salted PBKDF2 password hashes.
+
+Passwords are stored as ``pbkdf2_sha256$<iterations>$<salt>$<hash>``. The
+iteration count is read from each stored hash, so raising HASH_ITERATIONS
+only affects new passwords; old ones are re-hashed at the new cost on their
+next successful login.
+
+PBKDF2 is slow on purpose, which makes every login cost the same few hundred
+milliseconds. To keep re-login (e.g. after Logout) instant, a successful
+login caches an HMAC of the password under a random per-process key for
+SESSION_TTL seconds; a matching re-entry is accepted without re-hashing.
+Nothing from the cache ever touches disk.
+
+Repeated failures lock the account for LOCKOUT_SECONDS, doubling with each
+further failure up to MAX_LOCKOUT_SECONDS. The lock is stored in the
+database so restarting the app does not reset it.
+"""
+import binascii
+import hashlib
+import hmac
+import os
+import secrets
+import threading
+import time
+import warnings
+
+import database
+
+ALGORITHM = "pbkdf2_sha256"
+DEFAULT_HASH_ITERATIONS = 120000
+
+
+def configured_iterations():
+    """Read ESMS_HASH_ITERATIONS; fall back to the default if it isn't a positive integer."""
+    value = os.environ.get("ESMS_HASH_ITERATIONS")
+    if value is None:
+        return DEFAULT_HASH_ITERATIONS
+    try:
+        iterations = int(value)
+        if iterations > 0:
+            return iterations
+    except ValueError:
+        pass
+    warnings.warn("Ignoring ESMS_HASH_ITERATIONS={!r}; using {}.".format(
+        value, DEFAULT_HASH_ITERATIONS))
+    return DEFAULT_HASH_ITERATIONS
+
+
+HASH_ITERATIONS = configured_iterations()
+SALT_BYTES = 16
+
+MAX_FAILED_ATTEMPTS = 5
+LOCKOUT_SECONDS = 30
+MAX_LOCKOUT_SECONDS = 15 * 60
+
+SESSION_TTL = 8 * 3600
+
+DEFAULT_USERNAME = "admin"
+DEFAULT_PASSWORD = "admin"
+
+_cache_key = secrets.token_bytes(32)
+_credential_cache = {}   # username (lower) -> (hmac digest, expires_at)
+_sessions = {}           # token -> (username, expires_at)
+_lock = threading.Lock()
+
+
+def hash_password(password, iterations=None, salt=None):
+    """Return an encoded salted PBKDF2-SHA256 hash of `password`."""
+    iterations = iterations or HASH_ITERATIONS
+    salt = salt or secrets.token_bytes(SALT_BYTES)
+    digest = hashlib.pbkdf2_hmac("sha256", password.encode("utf-8"), salt, iterations)
+    return "{}${}${}${}".format(ALGORITHM, iterations,
+                                binascii.hexlify(salt).decode("ascii"),
+                                binascii.hexlify(digest).decode("ascii"))
+
+
+def parse_hash(encoded):
+    """Return (iterations, salt, digest) from an encoded hash."""
+    algorithm, iterations, salt, digest = encoded.split("$")
+    if algorithm != ALGORITHM:
+        raise ValueError("Unsupported password hash: {}".format(algorithm))
+    return int(iterations), binascii.unhexlify(salt), binascii.unhexlify(digest)
+
+
+def verify_password(password, encoded):
+    iterations, salt, expected = parse_hash(encoded)
+    digest = hashlib.pbkdf2_hmac("sha256", password.encode("utf-8"), salt, iterations)
+    return hmac.compare_digest(digest, expected)
+
+
+def get_user(username):
+    """Return (username, password_hash, failed_attempts, locked_until) or None."""
+    conn = None
+    try:
+        conn = database.get_connection()
+        cursor = conn.cursor()
+        cursor.execute('''
+            SELECT username, password_hash, failed_attempts, locked_until
+            FROM users WHERE username = ?
+        ''', (username,))
+        return cursor.fetchone()
+    finally:
+        if conn:
+            conn.close()
+
+
+def set_password(username, password):
+    """Create `username` or replace its password (also clears any lockout)."""
+    encoded = hash_password(password)
+    conn = None
+    try:
+        conn = database.get_connection()
+        cursor = conn.cursor()
+        cursor.execute('''
+            INSERT INTO users (username, password_hash) VALUES (?, ?)
+            ON CONFLICT (username) DO UPDATE SET
+                password_hash = excluded.password_hash,
+                failed_attempts = 0,
+                locked_until = 0
+        ''', (username, encoded))
+        conn.commit()
+    finally:
+        if conn:
+            conn.close()
+    forget_credentials(username)
+
+
+def ensure_default_user():
+    """Create the default admin account if there are no accounts yet."""
+    conn = None
+    try:
+        conn = database.get_connection()
+        cursor = conn.cursor()
+        cursor.execute('SELECT COUNT(*) FROM users')
+        if cursor.fetchone()[0] > 0:
+            return False
+    finally:
+        if conn:
+            conn.close()
+    set_password(DEFAULT_USERNAME, DEFAULT_PASSWORD)
+    return True
+
+
+def record_attempt(username, success, new_hash=None):
+    """Update the failure counter / lockout after a login attempt."""
+    conn = None
+    try:
+        conn = database.get_connection()
+        cursor = conn.cursor()
+        if success:
+            cursor.execute('''
+                UPDATE users SET failed_attempts = 0, locked_until = 0,
+                    password_hash = COALESCE(?, password_hash)
+                WHERE username = ?
+            ''', (new_hash, username))
+        else:
+            cursor.execute('SELECT failed_attempts FROM users WHERE username = ?', (username,))
+            failures = cursor.fetchone()[0] + 1
+            locked_until = 0
+            if failures >= MAX_FAILED_ATTEMPTS:
+                delay = LOCKOUT_SECONDS * 2 ** (failures - MAX_FAILED_ATTEMPTS)
+                locked_until = time.time() + min(delay, MAX_LOCKOUT_SECONDS)
+            cursor.execute('''
+                UPDATE users SET failed_attempts = ?, locked_until = ? WHERE username = ?
+            ''', (failures, locked_until, username))
+        conn.commit()
+    finally:
+        if conn:
+            conn.close()
+
+
+def cache_digest(username, password):
+    message = "{}\0{}".format(username.lower(), password).encode("utf-8")
+    return hmac.new(_cache_key, message, hashlib.sha256).digest()
+
+
+def check_cached(username, password):
+    with _lock:
+        entry = _credential_cache.get(username.lower())
+    if not entry or entry[1] < time.time():
+        return False
+    return hmac.compare_digest(entry[0], cache_digest(username, password))
+
+
+def forget_credentials(username):
+    with _lock:
+        _credential_cache.pop(username.lower(), None)
+
+
+def start_session(username):
+    token = secrets.token_hex(32)
+    now = time.time()
+    with _lock:
+        # Drop expired tokens so the table never outgrows the live sessions.
+        for expired in [t for t, entry in _sessions.items() if entry[1] < now]:
+            del _sessions[expired]
+        _sessions[token] = (username, now + SESSION_TTL)
+    return token
+
+
+def login(username, password):
+    """
+    Returns (token, '') on success or (None, reason) on failure.
+
+    Unknown usernames still pay for a hash so response time does not reveal
+    which accounts exist.
+    """
+    user = get_user(username)
+    if user is None:
+        hashlib.pbkdf2_hmac("sha256", password.encode("utf-8"), b"\0" * SALT_BYTES,
+                            HASH_ITERATIONS)
+        return None, "Invalid username or password."
+
+    username, encoded, failures, locked_until = user
+    remaining = int(locked_until - time.time() + 0.999)
+    if remaining > 0:
+        return None, ("Too many failed attempts.\n"
+                      "Try again in {} seconds.".format(remaining))
+
+    if check_cached(username, password):
+        return start_session(username), ""
+
+    if not verify_password(password, encoded):
+        record_attempt(username, success=False)
+        forget_credentials(username)
+        return None, "Invalid username or password."
+
+    new_hash = None
+    if parse_hash(encoded)[0] != HASH_ITERATIONS:
+        new_hash = hash_password(password)
+    if failures or new_hash:
+        record_attempt(username, success=True, new_hash=new_hash)
+
+    with _lock:
+        _credential_cache[username.lower()] = (cache_digest(username, password),
+                                               time.time() + SESSION_TTL)
+    return start_session(username), ""
+
+
+def session_user(token):
+    """Return the username for a live session token, else None."""
+    with _lock:
+        entry = _sessions.get(token)
+    if not entry or entry[1] < time.time():
+        return None
+    return entry[0]
+
+
+def logout(token):
+    """End the session. Cached credentials stay, so signing back in is instant."""
+    with _lock:
+        _sessions.pop(token, None)
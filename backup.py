@@ -0,0 +1,182 @@
+"""Online backups and rotating snapshots of the ESMS database.
+
+Uses SQLite's online backup API, copying a limited number of pages per step
+and sleeping between steps, so the app keeps reading and writing while a
+snapshot is taken. Snapshots are written to a temporary ``.part`` file and
+only renamed into place once complete, so a crash never leaves a truncated
+file that looks like a valid snapshot.
+"""
+import datetime
+import os
+import sqlite3
+import threading
+
+import database
+
+BACKUP_DIR = os.path.join(database.BASE_DIR, "backups")
+SNAPSHOT_PREFIX = "employees-"
+SNAPSHOT_SUFFIX = ".db"
+
+# 256 pages is 1 MB at the default 4 KB page size: small enough that each
+# step holds the read lock only briefly on slow mobile storage.
+PAGES_PER_STEP = 256
+STEP_SLEEP = 0.05
+
+
+def backup_to(dest_path, pages=PAGES_PER_STEP, sleep=STEP_SLEEP, progress=None):
+    """
+    Copy the live database to `dest_path` using the online backup API.
+
+    `progress(remaining, total)` is called after each step, if given.
+    """
+    tmp_path = dest_path + ".part"
+    src = dst = None
+    try:
+        src = database.get_connection()
+        dst = sqlite3.connect(tmp_path)
+
+        def _progress(status, remaining, total):
+            if progress:
+                progress(remaining, total)
+
+        src.backup(dst, pages=pages, progress=_progress, sleep=sleep)
+    except Exception:
+        if dst:
+            dst.close()
+            dst = None
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+    finally:
+        if dst:
+            dst.close()
+        if src:
+            src.close()
+    os.replace(tmp_path, dest_path)
+    return dest_path
+
+
+def list_snapshots(backup_dir=BACKUP_DIR):
+    """Return snapshot paths, oldest first."""
+    if not os.path.isdir(backup_dir):
+        return []
+    names = sorted(n for n in os.listdir(backup_dir)
+                   if n.startswith(SNAPSHOT_PREFIX) and n.endswith(SNAPSHOT_SUFFIX))
+    return [os.path.join(backup_dir, n) for n in names]
+
+
+def rotate_snapshots(keep, backup_dir=BACKUP_DIR):
+    """Delete all but the newest `keep` snapshots. Returns the removed paths."""
+    snapshots = list_snapshots(backup_dir)
+    removed = snapshots[:-keep] if keep > 0 else snapshots
+    for path in removed:
+        os.remove(path)
+    return removed
+
+
+def take_snapshot(keep=7, backup_dir=BACKUP_DIR, progress=None):
+    """Write a timestamped snapshot, then apply retention. Returns its path."""
+    os.makedirs(backup_dir, exist_ok=True)
+    stamp = datetime.datetime.now(datetime.timezone.utc).strftime("%Y%m%d-%H%M%S-%f")
+    path = os.path.join(backup_dir, "{}{}{}".format(SNAPSHOT_PREFIX, stamp, SNAPSHOT_SUFFIX))
+    backup_to(path, progress=progress)
+    rotate_snapshots(keep, backup_dir)
+    return path
+
+
+def verify_snapshot(path):
+    """Return True if `path` is a readable SQLite file holding an employees table."""
+    conn = None
+    try:
+        conn = sqlite3.connect("file:{}?mode=ro".format(path), uri=True)
+        cursor = conn.cursor()
+        cursor.execute('PRAGMA quick_check')
+        if cursor.fetchone()[0] != "ok":
+            return False
+        cursor.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'employees'")
+        return cursor.fetchone() is not None
+    except sqlite3.DatabaseError:
+        return False
+    finally:
+        if conn:
+            conn.close()
+
+
+def restore_snapshot(path, pages=-1):
+    """
+    Replace the live database contents with snapshot `path`.
+
+    The copy goes through the backup API into the live connection rather than
+    overwriting the file, so it is transactional and safe while other
+    connections are open. The whole file is copied in one step by default.
+    Snapshots older than the current schema are migrated right after the copy,
+    which also restores the journal and history triggers.
+
+    The restored database gets a new sync device id. Its change journal has
+    been rolled back, so new change_ids would repeat ones that peers have
+    already pulled past; as a new device it is pulled from the start instead,
+    with last-writer-wins deciding between the restored and newer records.
+    """
+    if not verify_snapshot(path):
+        raise ValueError("Snapshot is damaged or not an ESMS database:\n{}".format(path))
+    src = dst = None
+    try:
+        src = sqlite3.connect("file:{}?mode=ro".format(path), uri=True)
+        dst = database.get_connection()
+        src.backup(dst, pages=pages)
+        database.create_schema(dst)
+        dst.execute(
+            "UPDATE sync_meta SET value = lower(hex(randomblob(8))) WHERE key = 'device_id'")
+        dst.commit()
+    finally:
+        if dst:
+            dst.close()
+        if src:
+            src.close()
+
+
+class SnapshotScheduler:
+    """
+    Takes a snapshot every `interval` seconds on a daemon thread.
+
+    The first snapshot is taken as soon as the newest existing one is older
+    than `interval`, so restarting the app does not reset the schedule.
+    `on_error(exc)` is called if a snapshot fails; the scheduler keeps running.
+    """
+
+    def __init__(self, interval=24 * 3600, keep=7, backup_dir=BACKUP_DIR, on_error=None):
+        self.interval = interval
+        self.keep = keep
+        self.backup_dir = backup_dir
+        self.on_error = on_error
+        self.last_snapshot = None
+        self._stop = threading.Event()
+        self._thread = None
+
+    def seconds_until_due(self):
+        snapshots = list_snapshots(self.backup_dir)
+        if not snapshots:
+            return 0
+        age = datetime.datetime.now().timestamp() - os.path.getmtime(snapshots[-1])
+        return max(0, self.interval - age)
+
+    def start(self):
+        if self._thread is None or not self._thread.is_alive():
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name="esms-snapshots",
+                                            daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+
+    def _run(self):
+        while not self._stop.wait(self.seconds_until_due()):
+            try:
+                self.last_snapshot = take_snapshot(self.keep, self.backup_dir)
+            except Exception as e:
+                if self.on_error:
+                    self.on_error(e)
+                # Avoid a tight retry loop on persistent failures (e.g. full storage).
+                if self._stop.wait(min(self.interval, 600)):
+                    break
@@ -1,34 +1,319 @@
-import sqlite3
+import contextlib
 import os
+import threading
+
+import storage
 
 # Get the directory where database.py is located
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
 DB_PATH = os.path.join(BASE_DIR, "employees.db")
 
+# Editable employee fields, in table order (after employee_id).
+DATA_COLUMNS = ("name", "gender", "dob", "department", "position",
+                "status", "contact", "email", "address")
+
+# Columns replicated by sync: the editable fields plus the soft-delete tombstone.
+SYNC_COLUMNS = DATA_COLUMNS + ("deleted_at",)
+
+# Bump whenever create_schema() changes; an up-to-date file skips migration.
+SCHEMA_VERSION = 5
+
+TRIGGERS = ("employees_journal_insert", "employees_journal_update",
+            "employees_journal_delete", "employees_history_insert",
+            "employees_history_update", "employees_history_delete")
+
+# Columns returned by list_employees(); every listing index below contains all
+# of them, so filtered/sorted listings never touch the table itself.
+LIST_COLUMNS = ("employee_id", "name", "dob", "position", "department", "status")
+SORTABLE_COLUMNS = ("name", "dob", "position", "department", "status")
+FILTER_COLUMNS = ("department", "status", "position")
+
+# UTC, millisecond precision; sorts lexicographically in time order.
+TIMESTAMP_SQL = "strftime('%Y-%m-%dT%H:%M:%fZ', 'now')"
+
+
+# Active storage backend; None means a FileBackend on DB_PATH (see storage.py).
+# A per-thread override (using_thread_backend) takes precedence, so worker
+# threads can each talk to a different database at the same time.
+_backend = None
+_thread_state = threading.local()
+
+
+def get_backend():
+    backend = getattr(_thread_state, "backend", None)
+    if backend is None:
+        backend = _backend
+    return backend if backend is not None else storage.FileBackend(DB_PATH)
+
+
+def set_backend(backend):
+    """Route every database function through `backend` (None = DB_PATH). Returns the old one."""
+    global _backend
+    previous, _backend = _backend, backend
+    return previous
+
+
+@contextlib.contextmanager
+def using_backend(backend):
+    """Temporarily switch backends, e.g. ``with using_backend(storage.MemoryBackend()):``."""
+    previous = set_backend(backend)
+    try:
+        yield backend
+    finally:
+        set_backend(previous)
+
+
+@contextlib.contextmanager
+def using_thread_backend(backend):
+    """Like using_backend(), but only for database calls made on this thread."""
+    previous = getattr(_thread_state, "backend", None)
+    _thread_state.backend = backend
+    try:
+        yield backend
+    finally:
+        _thread_state.backend = previous
+
 
 def get_connection():
-    return sqlite3.connect(DB_PATH, timeout=10)
+    return get_backend().connect()
+
+
+def column_exists(cursor, table, column):
+    cursor.execute('PRAGMA table_info({})'.format(table))
+    return any(row[1] == column for row in cursor.fetchall())
+
+
+def create_schema(conn):
+    """Create tables, triggers and indexes on an open connection (idempotent)."""
+    cursor = conn.cursor()
+    cursor.execute('PRAGMA user_version')
+    if cursor.fetchone()[0] == SCHEMA_VERSION:
+        return
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS employees (
+            employee_id INTEGER PRIMARY KEY AUTOINCREMENT,
+            name TEXT NOT NULL,
+            gender TEXT,
+            dob TEXT,
+            department TEXT,
+            position TEXT,
+            status TEXT,
+            contact TEXT,
+            email TEXT,
+            address TEXT
+        )
+    ''')
+
+    # Sync columns are appended so existing SELECT * index positions stay valid.
+    # uid identifies a record across devices; updated_at drives conflict resolution.
+    migrated = False
+    if not column_exists(cursor, 'employees', 'uid'):
+        cursor.execute('ALTER TABLE employees ADD COLUMN uid TEXT')
+        migrated = True
+    if not column_exists(cursor, 'employees', 'updated_at'):
+        cursor.execute('ALTER TABLE employees ADD COLUMN updated_at TEXT')
+    cursor.execute('UPDATE employees SET uid = lower(hex(randomblob(16))) WHERE uid IS NULL')
+    cursor.execute(
+        "UPDATE employees SET updated_at = {} WHERE updated_at IS NULL".format(TIMESTAMP_SQL))
+    cursor.execute('CREATE UNIQUE INDEX IF NOT EXISTS idx_employees_uid ON employees (uid)')
+
+    # Soft delete: deleted_at is NULL for live rows. Read paths filter on it and
+    # use these partial indexes, which only ever contain live (or only dead) rows.
+    if not column_exists(cursor, 'employees', 'deleted_at'):
+        cursor.execute('ALTER TABLE employees ADD COLUMN deleted_at TEXT')
+    # Covering listing indexes, one per leading sort/filter column. Superseded
+    # the plain name index from schema version 1.
+    cursor.execute('DROP INDEX IF EXISTS idx_employees_live_name')
+    for lead in SORTABLE_COLUMNS:
+        rest = [c for c in LIST_COLUMNS[1:] if c not in (lead, "name")]
+        cols = [lead] + ([] if lead == "name" else ["name"]) + rest
+        cursor.execute('''
+            CREATE INDEX IF NOT EXISTS idx_employees_list_{lead}
+            ON employees ({cols}) WHERE deleted_at IS NULL
+        '''.format(lead=lead, cols=", ".join(cols)))
+    cursor.execute('''
+        CREATE INDEX IF NOT EXISTS idx_employees_live_email
+        ON employees (LOWER(email)) WHERE deleted_at IS NULL
+    ''')
+    cursor.execute('''
+        CREATE INDEX IF NOT EXISTS idx_employees_live_contact
+        ON employees (contact) WHERE deleted_at IS NULL
+    ''')
+    cursor.execute('''
+        CREATE INDEX IF NOT EXISTS idx_employees_tombstones
+        ON employees (deleted_at) WHERE deleted_at IS NOT NULL
+    ''')
+
+    # Append-only change journal: one row per insert/update/delete.
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS change_log (
+            change_id INTEGER PRIMARY KEY AUTOINCREMENT,
+            uid TEXT NOT NULL,
+            op TEXT NOT NULL,
+            changed_at TEXT NOT NULL
+        )
+    ''')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_change_log_uid ON change_log (uid, change_id)')
+    if migrated:
+        # Pre-existing rows have never been journaled; seed them so a first sync sees them.
+        cursor.execute('''
+            INSERT INTO change_log (uid, op, changed_at)
+            SELECT uid, 'I', updated_at FROM employees ORDER BY employee_id
+        ''')
+
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS sync_meta (
+            key TEXT PRIMARY KEY,
+            value TEXT
+        )
+    ''')
+    cursor.execute(
+        "INSERT OR IGNORE INTO sync_meta (key, value) VALUES ('device_id', lower(hex(randomblob(8))))")
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS sync_peers (
+            peer_id TEXT PRIMARY KEY,
+            last_pulled INTEGER NOT NULL DEFAULT 0,
+            last_exported INTEGER NOT NULL DEFAULT 0
+        )
+    ''')
+
+    # Triggers are recreated on every migration so their column lists follow
+    # the current schema.
+    for trigger in TRIGGERS:
+        cursor.execute('DROP TRIGGER IF EXISTS {}'.format(trigger))
+
+    # Early records stored dob as YYYY/MM/DD. Normalize to YYYY-MM-DD (what the
+    # form accepts) so dob ranges and sorting compare correctly as text. Done
+    # while the triggers are dropped: this is a format fix, not an edit.
+    cursor.execute("UPDATE employees SET dob = replace(dob, '/', '-') WHERE dob LIKE '%/%'")
+
+    cursor.execute('''
+        CREATE TRIGGER IF NOT EXISTS employees_journal_insert
+        AFTER INSERT ON employees
+        BEGIN
+            UPDATE employees SET
+                uid = COALESCE(NEW.uid, lower(hex(randomblob(16)))),
+                updated_at = COALESCE(NEW.updated_at, {ts})
+            WHERE employee_id = NEW.employee_id;
+            INSERT INTO change_log (uid, op, changed_at)
+            SELECT uid, 'I', updated_at FROM employees WHERE employee_id = NEW.employee_id;
+        END
+    '''.format(ts=TIMESTAMP_SQL))
+    # Only replicated columns fire the journal; a caller (e.g. sync) that sets
+    # updated_at explicitly keeps its timestamp instead of getting "now".
+    cursor.execute('''
+        CREATE TRIGGER IF NOT EXISTS employees_journal_update
+        AFTER UPDATE OF {cols} ON employees
+        BEGIN
+            UPDATE employees SET updated_at = {ts}
+            WHERE employee_id = NEW.employee_id AND NEW.updated_at IS OLD.updated_at;
+            INSERT INTO change_log (uid, op, changed_at)
+            SELECT uid, 'U', updated_at FROM employees WHERE employee_id = NEW.employee_id;
+        END
+    '''.format(cols=", ".join(SYNC_COLUMNS), ts=TIMESTAMP_SQL))
+    cursor.execute('''
+        CREATE TRIGGER IF NOT EXISTS employees_journal_delete
+        AFTER DELETE ON employees
+        BEGIN
+            INSERT INTO change_log (uid, op, changed_at) VALUES (OLD.uid, 'D', {ts});
+        END
+    '''.format(ts=TIMESTAMP_SQL))
+
+    # Versioned history: every insert/update stores the new row, every delete
+    # (soft or hard) a 'D' version, and a restore of a deleted row an 'I'.
+    # Rows that arrive already deleted (synced tombstones) are stored as 'D'.
+    # valid_from is the local time the version was written, so version_id
+    # order is time order. A 'B' (baseline) version replaces the older
+    # versions of an employee removed by compact_history().
+    cursor.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'employee_history'")
+    seed_history = cursor.fetchone() is None
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS employee_history (
+            version_id INTEGER PRIMARY KEY AUTOINCREMENT,
+            employee_id INTEGER NOT NULL,
+            op TEXT NOT NULL,
+            valid_from TEXT NOT NULL,
+            {cols}
+        )
+    '''.format(cols=",\n            ".join("{} TEXT".format(c) for c in DATA_COLUMNS)))
+    # Timeline and "latest version <= V" seeks for one employee.
+    cursor.execute('''
+        CREATE INDEX IF NOT EXISTS idx_history_employee
+        ON employee_history (employee_id, version_id)
+    ''')
+    # Resolve a timestamp to a version_id.
+    cursor.execute('''
+        CREATE INDEX IF NOT EXISTS idx_history_valid_from
+        ON employee_history (valid_from, version_id)
+    ''')
+    # One entry per employee ever created: drives roster-as-of without
+    # scanning every version.
+    cursor.execute('''
+        CREATE INDEX IF NOT EXISTS idx_history_first
+        ON employee_history (version_id, employee_id) WHERE op IN ('I', 'B')
+    ''')
+    if seed_history:
+        cursor.execute('''
+            INSERT INTO employee_history (employee_id, op, valid_from, {cols})
+            SELECT employee_id, CASE WHEN deleted_at IS NULL THEN 'I' ELSE 'D' END,
+                   updated_at, {cols}
+            FROM employees ORDER BY employee_id
+        '''.format(cols=", ".join(DATA_COLUMNS)))
+
+    hist_cols = ", ".join(DATA_COLUMNS)
+    cursor.execute('''
+        CREATE TRIGGER IF NOT EXISTS employees_history_insert
+        AFTER INSERT ON employees
+        BEGIN
+            INSERT INTO employee_history (employee_id, op, valid_from, {cols})
+            VALUES (NEW.employee_id,
+                    CASE WHEN NEW.deleted_at IS NULL THEN 'I' ELSE 'D' END,
+                    {ts}, {new});
+        END
+    '''.format(cols=hist_cols, ts=TIMESTAMP_SQL,
+               new=", ".join("NEW.{}".format(c) for c in DATA_COLUMNS)))
+    cursor.execute('''
+        CREATE TRIGGER IF NOT EXISTS employees_history_update
+        AFTER UPDATE OF {watch} ON employees
+        BEGIN
+            INSERT INTO employee_history (employee_id, op, valid_from, {cols})
+            VALUES (NEW.employee_id,
+                    CASE WHEN NEW.deleted_at IS NOT NULL THEN 'D'
+                         WHEN OLD.deleted_at IS NOT NULL THEN 'I'
+                         ELSE 'U' END,
+                    {ts}, {new});
+        END
+    '''.format(watch=", ".join(SYNC_COLUMNS), cols=hist_cols, ts=TIMESTAMP_SQL,
+               new=", ".join("NEW.{}".format(c) for c in DATA_COLUMNS)))
+    cursor.execute('''
+        CREATE TRIGGER IF NOT EXISTS employees_history_delete
+        AFTER DELETE ON employees WHEN OLD.deleted_at IS NULL
+        BEGIN
+            INSERT INTO employee_history (employee_id, op, valid_from, {cols})
+            VALUES (OLD.employee_id, 'D', {ts}, {old});
+        END
+    '''.format(cols=hist_cols, ts=TIMESTAMP_SQL,
+               old=", ".join("OLD.{}".format(c) for c in DATA_COLUMNS)))
+
+    # Login accounts (see auth.py). password_hash is a self-describing
+    # "pbkdf2_sha256$iterations$salt$hash" string; locked_until is epoch seconds.
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS users (
+            username TEXT PRIMARY KEY COLLATE NOCASE,
+            password_hash TEXT NOT NULL,
+            failed_attempts INTEGER NOT NULL DEFAULT 0,
+            locked_until REAL NOT NULL DEFAULT 0
+        )
+    ''')
+
+    cursor.execute('PRAGMA user_version = {}'.format(SCHEMA_VERSION))
 
 
 def init_db():
     conn = None
     try:
         conn = get_connection()
-        cursor = conn.cursor()
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS employees (
-                employee_id INTEGER PRIMARY KEY AUTOINCREMENT,
-                name TEXT NOT NULL,
-                gender TEXT,
-                dob TEXT,
-                department TEXT,
-                position TEXT,
-                status TEXT,
-                contact TEXT,
-                email TEXT,
-                address TEXT
-            )
-        ''')
+        create_schema(conn)
         conn.commit()
     finally:
         if conn:
@@ -58,7 +343,7 @@ def get_all_employees():
     try:
         conn = get_connection()
         cursor = conn.cursor()
-        cursor.execute('SELECT * FROM employees ORDER BY name ASC')
+        cursor.execute('SELECT * FROM employees WHERE deleted_at IS NULL ORDER BY name ASC')
         return cursor.fetchall()
     finally:
         if conn:
@@ -70,7 +355,8 @@ def get_employee_by_id(emp_id):
     try:
         conn = get_connection()
         cursor = conn.cursor()
-        cursor.execute('SELECT * FROM employees WHERE employee_id = ?', (emp_id,))
+        cursor.execute('SELECT * FROM employees WHERE employee_id = ? AND deleted_at IS NULL',
+                       (emp_id,))
         return cursor.fetchone()
     finally:
         if conn:
@@ -86,7 +372,7 @@ def update_employee(emp_id, data):
             UPDATE employees SET
                 name = ?, gender = ?, dob = ?, department = ?,
                 position = ?, status = ?, contact = ?, email = ?, address = ?
-            WHERE employee_id = ?
+            WHERE employee_id = ? AND deleted_at IS NULL
         ''', (
             data['name'], data['gender'], data['dob'], data['department'],
             data['position'], data['status'], data['contact'], data['email'], data['address'],
@@ -103,13 +389,65 @@ def delete_employee(emp_id):
     try:
         conn = get_connection()
         cursor = conn.cursor()
-        cursor.execute('DELETE FROM employees WHERE employee_id = ?', (emp_id,))
+        # Soft delete: the row stays as a tombstone until maintenance purges it.
+        cursor.execute('''
+            UPDATE employees SET deleted_at = {}
+            WHERE employee_id = ? AND deleted_at IS NULL
+        '''.format(TIMESTAMP_SQL), (emp_id,))
         conn.commit()
     finally:
         if conn:
             conn.close()
 
 
+def list_employees(sort_by="name", descending=False, search=None, department=None,
+                   status=None, position=None, dob_from=None, dob_to=None):
+    """
+    Sorted, filtered listing of live employees as LIST_COLUMNS tuples.
+
+    Empty filters are ignored. dob_from/dob_to are inclusive YYYY-MM-DD bounds.
+    Rows with equal sort values are ordered by name.
+    """
+    if sort_by not in SORTABLE_COLUMNS:
+        raise ValueError("Cannot sort by '{}'.".format(sort_by))
+
+    clauses = ["deleted_at IS NULL"]
+    params = []
+    for column, value in zip(FILTER_COLUMNS, (department, status, position)):
+        if value:
+            clauses.append("{} = ?".format(column))
+            params.append(value)
+    if dob_from:
+        clauses.append("dob >= ?")
+        params.append(dob_from)
+    if dob_to:
+        clauses.append("dob <= ?")
+        params.append(dob_to)
+    if search:
+        search_term = "%{}%".format(search)
+        clauses.append("(name LIKE ? OR department LIKE ? OR position LIKE ?)")
+        params.extend([search_term, search_term, search_term])
+
+    order = "{} {}".format(sort_by, "DESC" if descending else "ASC")
+    if sort_by != "name":
+        order += ", name ASC"
+
+    conn = None
+    try:
+        conn = get_connection()
+        cursor = conn.cursor()
+        cursor.execute('''
+            SELECT {cols} FROM employees
+            WHERE {where}
+            ORDER BY {order}
+        '''.format(cols=", ".join(LIST_COLUMNS), where=" AND ".join(clauses), order=order),
+            params)
+        return cursor.fetchall()
+    finally:
+        if conn:
+            conn.close()
+
+
 def search_employees(query):
     conn = None
     try:
@@ -118,7 +456,8 @@ def search_employees(query):
         search_term = "%{}%".format(query)
         cursor.execute('''
             SELECT * FROM employees
-            WHERE name LIKE ? OR department LIKE ? OR position LIKE ?
+            WHERE deleted_at IS NULL
+              AND (name LIKE ? OR department LIKE ? OR position LIKE ?)
             ORDER BY name ASC
         ''', (search_term, search_term, search_term))
         return cursor.fetchall()
@@ -142,9 +481,11 @@ def check_name_exists(name, exclude_id=None):
         conn = get_connection()
         cursor = conn.cursor()
         if exclude_id:
-            cursor.execute('SELECT name FROM employees WHERE employee_id != ?', (exclude_id,))
+            cursor.execute(
+                'SELECT name FROM employees WHERE deleted_at IS NULL AND employee_id != ?',
+                (exclude_id,))
         else:
-            cursor.execute('SELECT name FROM employees')
+            cursor.execute('SELECT name FROM employees WHERE deleted_at IS NULL')
         all_names = [row[0] for row in cursor.fetchall()]
     finally:
         if conn:
@@ -169,12 +510,13 @@ def check_email_exists(email, exclude_id=None):
         cursor = conn.cursor()
         if exclude_id:
             cursor.execute(
-                'SELECT COUNT(*) FROM employees WHERE LOWER(email) = LOWER(?) AND employee_id != ?',
+                'SELECT COUNT(*) FROM employees WHERE LOWER(email) = LOWER(?) AND deleted_at IS NULL '
+                'AND employee_id != ?',
                 (email, exclude_id)
             )
         else:
             cursor.execute(
-                'SELECT COUNT(*) FROM employees WHERE LOWER(email) = LOWER(?)',
+                'SELECT COUNT(*) FROM employees WHERE LOWER(email) = LOWER(?) AND deleted_at IS NULL',
                 (email,)
             )
         count = cursor.fetchone()[0]
@@ -192,12 +534,13 @@ def check_contact_exists(contact, exclude_id=None):
         cursor = conn.cursor()
         if exclude_id:
             cursor.execute(
-                'SELECT COUNT(*) FROM employees WHERE contact = ? AND employee_id != ?',
+                'SELECT COUNT(*) FROM employees WHERE contact = ? AND deleted_at IS NULL '
+                'AND employee_id != ?',
                 (contact, exclude_id)
             )
         else:
             cursor.execute(
-                'SELECT COUNT(*) FROM employees WHERE contact = ?',
+                'SELECT COUNT(*) FROM employees WHERE contact = ? AND deleted_at IS NULL',
                 (contact,)
             )
         count = cursor.fetchone()[0]
@@ -207,6 +550,132 @@ def check_contact_exists(contact, exclude_id=None):
             conn.close()
 
 
+def as_of_timestamp(when):
+    """Accept 'YYYY-MM-DD' (end of that day, UTC) or a full ISO timestamp."""
+    when = when.strip()
+    if len(when) == 10:
+        return when + "T23:59:59.999Z"
+    return when
+
+
+def history_cutoff(cursor, when):
+    """
+    Return the last version_id written at or before `when`, or None.
+
+    One seek to the end of the valid_from range; MAX(version_id) with a
+    valid_from filter walks back from the newest version instead.
+    """
+    cursor.execute('''
+        SELECT version_id FROM employee_history WHERE valid_from <= ?
+        ORDER BY valid_from DESC, version_id DESC LIMIT 1
+    ''', (as_of_timestamp(when),))
+    row = cursor.fetchone()
+    return row[0] if row else None
+
+
+def get_employee_history(emp_id):
+    """
+    Return every stored version of one employee, oldest first, as
+    (version_id, op, valid_from, name, gender, dob, department, position,
+    status, contact, email, address). op is 'I'nsert, 'U'pdate, 'D'elete or
+    'B'aseline (versions before it were compacted away).
+    """
+    conn = None
+    try:
+        conn = get_connection()
+        cursor = conn.cursor()
+        cursor.execute('''
+            SELECT version_id, op, valid_from, {cols} FROM employee_history
+            WHERE employee_id = ? ORDER BY version_id
+        '''.format(cols=", ".join(DATA_COLUMNS)), (emp_id,))
+        return cursor.fetchall()
+    finally:
+        if conn:
+            conn.close()
+
+
+def get_employees_as_of(when):
+    """
+    Return the roster as it was at `when`, sorted by name, in the same
+    column order as get_all_employees() up to address.
+
+    Each employee costs two index seeks (creation entry, then latest version
+    at or before the cutoff), so the query does not grow with the number of
+    versions per employee.
+    """
+    conn = None
+    try:
+        conn = get_connection()
+        cursor = conn.cursor()
+        cutoff = history_cutoff(cursor, when)
+        if cutoff is None:
+            return []
+        cursor.execute('''
+            SELECT h.employee_id, {cols}
+            FROM (SELECT DISTINCT employee_id FROM employee_history
+                  WHERE op IN ('I', 'B') AND version_id <= :cutoff) AS first
+            JOIN employee_history AS h ON h.version_id = (
+                SELECT MAX(version_id) FROM employee_history
+                WHERE employee_id = first.employee_id AND version_id <= :cutoff
+            )
+            WHERE h.op != 'D'
+            ORDER BY h.name ASC
+        '''.format(cols=", ".join("h.{}".format(c) for c in DATA_COLUMNS)),
+            {"cutoff": cutoff})
+        return cursor.fetchall()
+    finally:
+        if conn:
+            conn.close()
+
+
+def compact_history(before):
+    """
+    Collapse history older than `before` to one baseline version per employee.
+
+    As-of queries for `before` and later return the same results afterwards;
+    earlier dates are no longer reconstructable. Employees deleted before the
+    cutoff lose their history entirely. Returns the number of versions removed.
+    """
+    conn = None
+    try:
+        conn = get_connection()
+        cursor = conn.cursor()
+        cutoff = history_cutoff(cursor, before)
+        if cutoff is None:
+            return 0
+        cursor.execute('DROP TABLE IF EXISTS temp.history_keep')
+        cursor.execute('''
+            CREATE TEMP TABLE history_keep AS
+            SELECT employee_id, MAX(version_id) AS version_id FROM employee_history
+            WHERE version_id <= ? GROUP BY employee_id
+        ''', (cutoff,))
+        # Deleted as of the cutoff: nothing left to reconstruct up to it. A later
+        # restore starts again with its own 'I' version, which is kept.
+        cursor.execute('''
+            DELETE FROM employee_history WHERE version_id <= ? AND employee_id IN (
+                SELECT k.employee_id FROM temp.history_keep AS k
+                JOIN employee_history AS h ON h.version_id = k.version_id
+                WHERE h.op = 'D'
+            )
+        ''', (cutoff,))
+        removed = cursor.rowcount
+        cursor.execute('''
+            DELETE FROM employee_history
+            WHERE version_id <= ? AND version_id NOT IN (SELECT version_id FROM temp.history_keep)
+        ''', (cutoff,))
+        removed += cursor.rowcount
+        cursor.execute('''
+            UPDATE employee_history SET op = 'B'
+            WHERE op = 'U' AND version_id IN (SELECT version_id FROM temp.history_keep)
+        ''')
+        cursor.execute('DROP TABLE temp.history_keep')
+        conn.commit()
+        return removed
+    finally:
+        if conn:
+            conn.close()
+
+
 if __name__ == "__main__":
     init_db()
     print("Database initialized.")
@@ -1,9 +1,20 @@
+import time
+
+# Taken before any other import so startup timings include module loading.
+STARTUP_T0 = time.perf_counter()
+
 import tkinter as tk
 from tkinter import ttk, messagebox
 import datetime
+import os
 import re
+import threading
+import auth
 import database
 
+STARTUP_LOG = os.path.join(database.BASE_DIR, "startup.json")
+IMPORTS_DONE = time.perf_counter()
+
 
 # ---------------------------------------------------------------------------
 # Helpers
@@ -121,19 +132,96 @@ class ESMSApp(tk.Tk):
         self.container = tk.Frame(self, bg=self.BG_COLOR)
         self.container.pack(fill="both", expand=True)
 
+        # Startup: show the login screen first, prepare the database behind it.
+        # Frames that need the database go through when_ready().
+        self.startup_timings = {}
+        self.mark_startup("imports_done", IMPORTS_DONE)
+        self.db_error = None
+        self.session_token = None
+        self._db_ready = threading.Event()
+        self._ready_callbacks = []
+
+        self.show_frame("LoginFrame")
+        self.mark_startup("login_built")
+        self.after_idle(lambda: self.mark_startup("first_frame"))
+
+        threading.Thread(target=self._prepare_database, name="esms-startup",
+                         daemon=True).start()
+        self.after(50, self._poll_startup)
+
+    def mark_startup(self, phase, at=None):
+        """Record `phase` in ms since process start (thread-safe: plain dict set)."""
+        at = time.perf_counter() if at is None else at
+        self.startup_timings[phase] = round((at - STARTUP_T0) * 1000, 1)
+
+    def _prepare_database(self):
+        """Worker thread: schema check/migration, then warm the page cache."""
         try:
             database.init_db()
+            auth.ensure_default_user()
+            self.mark_startup("schema_ready")
+            database.get_all_employees()
+            self.mark_startup("cache_warm")
         except Exception as e:
+            self.db_error = e
+        finally:
+            self._db_ready.set()
+
+    def _poll_startup(self):
+        if not self._db_ready.is_set():
+            self.after(50, self._poll_startup)
+            return
+        if self.db_error is not None:
             messagebox.showerror("Database Error",
                                  "Failed to initialize database.\n"
                                  "Check file permissions and storage.\n\n"
-                                 "Detail: {}".format(str(e)))
+                                 "Detail: {}".format(str(self.db_error)))
             self.destroy()
             return
 
-        self.show_frame("LoginFrame")
+        self._start_background_services()
+        self.mark_startup("services_started")
+        self._save_startup_timings()
+
+        callbacks, self._ready_callbacks = self._ready_callbacks, []
+        for callback in callbacks:
+            callback()
+
+    def when_ready(self, callback):
+        """Run `callback` now if the database is ready, else once it is."""
+        if self._db_ready.is_set() and self.db_error is None:
+            callback()
+        else:
+            self._ready_callbacks.append(callback)
+
+    def _start_background_services(self):
+        # Imported here, not at module level: nothing in them is needed
+        # before the first frame.
+        import backup
+        import maintenance
+
+        # Daily online snapshots with 7-day retention, taken off the UI thread.
+        self.snapshots = backup.SnapshotScheduler(interval=24 * 3600, keep=7)
+        self.snapshots.start()
+        # Weekly tombstone purge + incremental vacuum, also off the UI thread.
+        self.maintenance = maintenance.MaintenanceScheduler()
+        self.maintenance.start()
+
+    def _save_startup_timings(self):
+        import json
+        try:
+            with open(STARTUP_LOG, "w", encoding="utf-8") as fh:
+                json.dump(self.startup_timings, fh, indent=2)
+        except OSError:
+            pass  # timings are diagnostic only; never block startup on them
 
     def show_frame(self, page_name, **kwargs):
+        # Every screen except the login needs a live session; an expired or
+        # missing one sends the user back to sign in.
+        if page_name != "LoginFrame" and auth.session_user(self.session_token) is None:
+            self.session_token = None
+            page_name = "LoginFrame"
+
         for frame in self.container.winfo_children():
             frame.destroy()
 
@@ -193,7 +281,6 @@ class LoginFrame(tk.Frame):
                  font=("Helvetica", 9, "bold")).pack(anchor="w")
         self.password_entry = ttk.Entry(form_card, show="*")
         self.password_entry.pack(fill="x", pady=(5, 0))
-        self.password_entry.insert(0, "admin")
         self.password_entry.bind("<Button-1>",
             lambda e: self.password_entry.after(50, self.password_entry.focus_force))
         self.password_entry.bind("<Return>", lambda e: self.login())
@@ -208,18 +295,45 @@ class LoginFrame(tk.Frame):
                        activebackground=controller.CARD_BG,
                        font=("Helvetica", 8)).pack(anchor="w", pady=(5, 15))
 
-        ttk.Button(form_card, text="LOGIN", command=self.login).pack(fill="x")
+        self.login_button = ttk.Button(form_card, text="LOGIN", command=self.login)
+        self.login_button.pack(fill="x")
+        self.status_label = tk.Label(form_card, text="", bg=controller.CARD_BG,
+                                     fg="#7f8c8d", font=("Helvetica", 8))
+        self.status_label.pack(anchor="w", pady=(8, 0))
+        self.login_pending = False
 
         tk.Label(main_box, text="\u00a9 2026 ESMS Solution", font=("Helvetica", 8),
                  bg=controller.BG_COLOR, fg="#7f8c8d").pack(side="bottom", pady=15)
 
     def login(self):
+        # Accounts live in the database; wait for startup to finish preparing it.
+        # Only one attempt is queued, so repeated taps can't stack failures.
+        if self.login_pending:
+            return
+        self.login_pending = True
+        self.login_button.state(["disabled"])
+        self.status_label.config(text="Preparing database\u2026")
+        self.controller.when_ready(self.run_pending_login)
+
+    def run_pending_login(self):
+        self.login_pending = False
+        self.login_button.state(["!disabled"])
+        self.status_label.config(text="")
+        self.attempt_login()
+
+    def attempt_login(self):
         username = self.username_entry.get().strip()
         password = self.password_entry.get().strip()
-        if username == "admin" and password == "admin":
+        try:
+            token, reason = auth.login(username, password)
+        except Exception as e:
+            return messagebox.showerror("Login Failed",
+                                        "Could not check credentials.\n\n{}".format(str(e)))
+        if token:
+            self.controller.session_token = token
             self.controller.show_frame("DashboardFrame")
         else:
-            messagebox.showerror("Login Failed", "Invalid username or password.")
+            messagebox.showerror("Login Failed", reason)
 
 
 # ---------------------------------------------------------------------------
@@ -245,9 +359,14 @@ class DashboardFrame(tk.Frame):
 
         tk.Button(header_bar, text="Logout", font=("Helvetica", 9),
                   bg="#e74c3c", fg="white", borderwidth=0, padx=12,
-                  command=lambda: controller.show_frame("LoginFrame")
+                  command=self.logout
                   ).pack(side="right", padx=side_pad)
 
+        tk.Button(header_bar, text="Report", font=("Helvetica", 9),
+                  bg="#ecf0f1", fg=controller.TEXT_COLOR, borderwidth=0, padx=12,
+                  command=self.export_report
+                  ).pack(side="right")
+
         # Action Bar (bottom)
         action_bar = tk.Frame(self, bg=controller.HEADER_COLOR,
                               highlightbackground="#ddd", highlightthickness=1)
@@ -296,6 +415,25 @@ class DashboardFrame(tk.Frame):
         self.search_entry.bind("<Button-1>",
             lambda e: self.search_entry.after(50, self.search_entry.focus_force))
 
+        # Filters (applied by the database, combined with the search text)
+        filter_bar = tk.Frame(content_box, bg=controller.BG_COLOR)
+        filter_bar.pack(fill="x", pady=(0, 10))
+
+        self.department_filter = ttk.Combobox(
+            filter_bar, state="readonly",
+            values=["ALL DEPARTMENTS", "HR", "IT", "SALES", "FINANCE",
+                    "MARKETING", "OPERATIONS", "OTHERS"])
+        self.department_filter.set("ALL DEPARTMENTS")
+        self.department_filter.pack(side="left", fill="x", expand=True, padx=(0, 4))
+        self.department_filter.bind("<<ComboboxSelected>>", lambda e: self.refresh_list())
+
+        self.status_filter = ttk.Combobox(
+            filter_bar, state="readonly",
+            values=["ALL STATUSES", "ACTIVE", "INACTIVE", "TERMINATED", "ON LEAVE"])
+        self.status_filter.set("ALL STATUSES")
+        self.status_filter.pack(side="left", fill="x", expand=True, padx=(4, 0))
+        self.status_filter.bind("<<ComboboxSelected>>", lambda e: self.refresh_list())
+
         # Employee list (Treeview handles its own scrolling)
         tree_wrapper = tk.Frame(content_box, bg=controller.CARD_BG,
                                 highlightbackground="#e0e0e0", highlightthickness=1)
@@ -304,9 +442,14 @@ class DashboardFrame(tk.Frame):
         avail_width = controller.app_width - (side_pad * 2) - 4
         cols = ("name", "dob", "position")
         self.tree = ttk.Treeview(tree_wrapper, columns=cols, show="headings")
-        self.tree.heading("name", text="NAME")
-        self.tree.heading("dob", text="DOB")
-        self.tree.heading("position", text="POSITION")
+        # Tap a heading to sort by it; tap again to reverse. Sorting is done
+        # by the database (see database.list_employees).
+        self.heading_labels = {"name": "NAME", "dob": "DOB", "position": "POSITION"}
+        self.sort_column = "name"
+        self.sort_descending = False
+        for col in cols:
+            self.tree.heading(col, text=self.heading_labels[col],
+                              command=lambda c=col: self.sort_by(c))
         self.tree.column("name", width=int(avail_width * 0.40), minwidth=60)
         self.tree.column("dob",  width=int(avail_width * 0.35), minwidth=50)
         self.tree.column("position", width=int(avail_width * 0.25), minwidth=40)
@@ -315,6 +458,20 @@ class DashboardFrame(tk.Frame):
         self.row_ids = {}
         self.refresh_list()
 
+    def logout(self):
+        auth.logout(self.controller.session_token)
+        self.controller.session_token = None
+        self.controller.show_frame("LoginFrame")
+
+    def export_report(self):
+        import reports
+        try:
+            path = reports.generate_report(fmt="html", roster=True)
+            messagebox.showinfo("Report Saved",
+                                "Headcount and demographics report saved to:\n\n{}".format(path))
+        except Exception as e:
+            messagebox.showerror("Error", "Could not create report.\n\n{}".format(str(e)))
+
     def format_dob(self, date_str):
         if not date_str:
             return "-"
@@ -324,16 +481,37 @@ class DashboardFrame(tk.Frame):
         except Exception:
             return date_str
 
+    def sort_by(self, column):
+        if column == self.sort_column:
+            self.sort_descending = not self.sort_descending
+        else:
+            self.sort_column = column
+            self.sort_descending = False
+        self.refresh_list()
+
+    def update_headings(self):
+        arrow = " \u25bc" if self.sort_descending else " \u25b2"
+        for col, label in self.heading_labels.items():
+            self.tree.heading(col, text=label + (arrow if col == self.sort_column else ""))
+
     def refresh_list(self):
         for item in self.tree.get_children():
             self.tree.delete(item)
         self.row_ids = {}
+        self.update_headings()
         try:
-            query = self.search_entry.get().strip()
-            employees = database.search_employees(query) if query else database.get_all_employees()
+            department = self.department_filter.get()
+            status = self.status_filter.get()
+            employees = database.list_employees(
+                sort_by=self.sort_column,
+                descending=self.sort_descending,
+                search=self.search_entry.get().strip(),
+                department=None if department.startswith("ALL") else department,
+                status=None if status.startswith("ALL") else status)
+            # Rows follow database.LIST_COLUMNS: id, name, dob, position, ...
             for emp in employees:
-                formatted_dob = self.format_dob(emp[3])
-                iid = self.tree.insert("", "end", values=(emp[1], formatted_dob, emp[5]))
+                formatted_dob = self.format_dob(emp[2])
+                iid = self.tree.insert("", "end", values=(emp[1], formatted_dob, emp[3]))
                 self.row_ids[iid] = emp[0]
             self.count_var.set(str(len(employees)))
         except Exception as e:
@@ -0,0 +1,189 @@
+"""Background database maintenance.
+
+``delete_employee`` only marks rows as deleted. This module purges those
+tombstones once they are old enough (giving sync peers time to receive the
+delete), returns the freed pages to the filesystem with
+``PRAGMA incremental_vacuum`` and refreshes planner statistics. Everything
+runs on a daemon thread in small transactions so the UI is never blocked for
+long, and each run writes a JSON report with the space it reclaimed.
+"""
+import datetime
+import json
+import os
+import threading
+import time
+
+import database
+
+REPORT_PATH = os.path.join(database.BASE_DIR, "maintenance.json")
+
+PURGE_BATCH_SIZE = 500
+TOMBSTONE_RETENTION_DAYS = 30
+
+
+def database_size(cursor):
+    """Return (page_size, page_count, freelist_count) for the open database."""
+    cursor.execute('PRAGMA page_size')
+    page_size = cursor.fetchone()[0]
+    cursor.execute('PRAGMA page_count')
+    page_count = cursor.fetchone()[0]
+    cursor.execute('PRAGMA freelist_count')
+    freelist = cursor.fetchone()[0]
+    return page_size, page_count, freelist
+
+
+def purge_tombstones(older_than_days=TOMBSTONE_RETENTION_DAYS, batch_size=PURGE_BATCH_SIZE,
+                     pause=0.01):
+    """
+    Hard-delete soft-deleted employees older than `older_than_days`.
+
+    Works in batches of `batch_size`, committing (and briefly sleeping) between
+    them so other connections can get the write lock. Returns rows purged.
+    """
+    cutoff = (datetime.datetime.now(datetime.timezone.utc)
+              - datetime.timedelta(days=older_than_days)).strftime("%Y-%m-%dT%H:%M:%S.000Z")
+    purged = 0
+    conn = None
+    try:
+        conn = database.get_connection()
+        cursor = conn.cursor()
+        while True:
+            cursor.execute('''
+                DELETE FROM employees WHERE employee_id IN (
+                    SELECT employee_id FROM employees
+                    WHERE deleted_at IS NOT NULL AND deleted_at <= ?
+                    LIMIT ?
+                )
+            ''', (cutoff, batch_size))
+            count = cursor.rowcount
+            conn.commit()
+            purged += count
+            if count < batch_size:
+                return purged
+            time.sleep(pause)
+    finally:
+        if conn:
+            conn.close()
+
+
+def ensure_incremental_vacuum(cursor):
+    """
+    Switch the file to auto_vacuum=INCREMENTAL if needed.
+
+    Changing the mode on an existing file only takes effect after a full
+    VACUUM, so this is a one-off cost on the first maintenance run.
+    Returns True if the file was converted.
+    """
+    cursor.execute('PRAGMA auto_vacuum')
+    if cursor.fetchone()[0] == 2:
+        return False
+    cursor.execute('PRAGMA auto_vacuum = INCREMENTAL')
+    cursor.execute('VACUUM')
+    return True
+
+
+def run_maintenance(older_than_days=TOMBSTONE_RETENTION_DAYS, batch_size=PURGE_BATCH_SIZE,
+                    report_path=REPORT_PATH):
+    """Purge tombstones, vacuum and optimize. Returns (and saves) a report dict."""
+    started = time.time()
+    purged = purge_tombstones(older_than_days, batch_size)
+
+    conn = None
+    try:
+        conn = database.get_connection()
+        cursor = conn.cursor()
+        page_size, pages_before, free_before = database_size(cursor)
+        converted = ensure_incremental_vacuum(cursor)
+        cursor.execute('PRAGMA incremental_vacuum')
+        cursor.fetchall()
+        cursor.execute('ANALYZE')
+        cursor.execute('PRAGMA optimize')
+        conn.commit()
+        page_size, pages_after, free_after = database_size(cursor)
+    finally:
+        if conn:
+            conn.close()
+
+    report = {
+        "finished_at": datetime.datetime.now(datetime.timezone.utc).strftime(
+            "%Y-%m-%dT%H:%M:%SZ"),
+        "purged_rows": purged,
+        "converted_to_incremental": converted,
+        "size_before": pages_before * page_size,
+        "size_after": pages_after * page_size,
+        "reclaimed_bytes": max(0, (pages_before - pages_after) * page_size),
+        "free_pages_before": free_before,
+        "free_pages_after": free_after,
+        "seconds": round(time.time() - started, 3),
+    }
+    save_report(report, report_path)
+    return report
+
+
+def save_report(report, path=REPORT_PATH):
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as fh:
+        json.dump(report, fh, indent=2)
+    os.replace(tmp_path, path)
+
+
+def load_report(path=REPORT_PATH):
+    """Return the last maintenance report, or None if maintenance never ran."""
+    try:
+        with open(path, "r", encoding="utf-8") as fh:
+            return json.load(fh)
+    except (OSError, ValueError):
+        return None
+
+
+class MaintenanceScheduler:
+    """
+    Runs ``run_maintenance`` every `interval` seconds on a daemon thread.
+
+    The schedule is measured from the last saved report, so short app sessions
+    still get maintenance once the interval has passed. The first run waits at
+    least `startup_delay` seconds to stay out of the way of app startup.
+    `on_complete(report)` / `on_error(exc)` are called from the worker thread.
+    """
+
+    def __init__(self, interval=7 * 24 * 3600, startup_delay=60, report_path=REPORT_PATH,
+                 on_complete=None, on_error=None):
+        self.interval = interval
+        self.startup_delay = startup_delay
+        self.report_path = report_path
+        self.on_complete = on_complete
+        self.on_error = on_error
+        self.last_report = None
+        self._stop = threading.Event()
+        self._thread = None
+
+    def seconds_until_due(self):
+        try:
+            age = time.time() - os.path.getmtime(self.report_path)
+        except OSError:
+            return 0
+        return max(0, self.interval - age)
+
+    def start(self):
+        if self._thread is None or not self._thread.is_alive():
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name="esms-maintenance",
+                                            daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+
+    def _run(self):
+        delay = max(self.startup_delay, self.seconds_until_due())
+        while not self._stop.wait(delay):
+            try:
+                self.last_report = run_maintenance(report_path=self.report_path)
+                if self.on_complete:
+                    self.on_complete(self.last_report)
+                delay = self.interval
+            except Exception as e:
+                if self.on_error:
+                    self.on_error(e)
+                # Retry later rather than spinning on a persistent failure.
+                delay = min(self.interval, 600)
@@ -0,0 +1,264 @@
+"""Headcount and demographics reports.
+
+All figures come from one aggregate query (a single pass over the covering
+listing index) grouped by department, status and age band; the three report
+sections are rolled up from that small result in Python. Output is streamed
+row by row to CSV or HTML, including the optional full roster, so memory use
+does not grow with the number of employees.
+
+Results are cached against ``PRAGMA data_version`` read from a long-lived
+watcher connection: the value only changes when another connection commits,
+so an unchanged database re-uses the cached figures (and an identical,
+already-written report file) without querying again. Because ages move with
+the calendar, the cache is also keyed by today's date.
+
+The request asked for tenure summaries, but employees have no hire date, so
+the per-department summary covers headcount, active count and age instead.
+"""
+import csv
+import datetime
+import html
+import os
+import threading
+
+import database
+
+REPORT_DIR = os.path.join(database.BASE_DIR, "reports")
+ROSTER_BATCH = 500
+
+AGE_BANDS = ("UNDER 20", "20-29", "30-39", "40-49", "50-59", "60+", "UNKNOWN")
+
+# Whole years between dob and :today (a YYYY-MM-DD parameter, the same local
+# date the cache is keyed by); dob may use '-' or '/' separators. Rows whose
+# dob doesn't start with a 4-digit year get NULL.
+AGE_SQL = '''
+    CASE WHEN substr(dob, 1, 4) GLOB '[0-9][0-9][0-9][0-9]' THEN
+        CAST(strftime('%Y', :today) AS INTEGER) - CAST(substr(dob, 1, 4) AS INTEGER)
+        - (strftime('%m-%d', :today) < substr(replace(dob, '/', '-'), 6, 5))
+    END
+'''
+
+_watchers = {}   # repr(backend) -> sqlite3 connection kept open for data_version
+# Ages depend on today's date, so cached results are only valid for the day
+# they were computed on as well as for the data_version.
+_cache = {}      # repr(backend) -> ((data_version, date), summary)
+_written = {}    # (repr(backend), path, fmt, roster) -> ((data_version, date), mtime)
+_lock = threading.Lock()
+
+
+def age_band(age):
+    if age is None or age < 0:
+        return "UNKNOWN"
+    if age < 20:
+        return "UNDER 20"
+    if age >= 60:
+        return "60+"
+    return "{0}-{1}".format(age // 10 * 10, age // 10 * 10 + 9)
+
+
+def data_version():
+    """Return (backend key, data_version) for the active backend."""
+    backend = database.get_backend()
+    key = repr(backend)
+    with _lock:
+        conn = _watchers.get(key)
+        if conn is None:
+            # Only ever used under _lock, from whichever thread asks.
+            conn = backend.connect(check_same_thread=False)
+            _watchers[key] = conn
+            if hasattr(backend, "on_close"):
+                backend.on_close(lambda: forget_backend(key))
+        return key, conn.execute('PRAGMA data_version').fetchone()[0]
+
+
+def forget_backend(key):
+    """Close the watcher for backend `key` and drop everything cached for it."""
+    with _lock:
+        conn = _watchers.pop(key, None)
+        _cache.pop(key, None)
+        for written_key in [k for k in _written if k[0] == key]:
+            del _written[written_key]
+    if conn:
+        conn.close()
+
+
+def compute_summary(today=None):
+    """
+    Return a dict with 'by_department_status', 'age_distribution' and
+    'departments' (per-department totals and age stats), from one query.
+    Ages are as of `today` (a date; default: the local date).
+    """
+    today = today or datetime.date.today()
+    conn = None
+    try:
+        conn = database.get_connection()
+        cursor = conn.cursor()
+        cursor.execute('''
+            SELECT department, status, age, COUNT(*)
+            FROM (SELECT department, status, {age} AS age
+                  FROM employees WHERE deleted_at IS NULL)
+            GROUP BY department, status, age
+        '''.format(age=AGE_SQL), {"today": today.isoformat()})
+        groups = cursor.fetchall()
+    finally:
+        if conn:
+            conn.close()
+
+    by_status = {}
+    bands = dict((band, 0) for band in AGE_BANDS)
+    departments = {}
+    for department, status, age, count in groups:
+        department = department or "UNASSIGNED"
+        status = status or "UNKNOWN"
+        by_status[(department, status)] = by_status.get((department, status), 0) + count
+        bands[age_band(age)] += count
+
+        dept = departments.setdefault(department, {
+            "headcount": 0, "active": 0, "aged": 0, "age_total": 0,
+            "youngest": None, "oldest": None,
+        })
+        dept["headcount"] += count
+        if status == "ACTIVE":
+            dept["active"] += count
+        if age is not None and age >= 0:
+            dept["aged"] += count
+            dept["age_total"] += age * count
+            dept["youngest"] = age if dept["youngest"] is None else min(dept["youngest"], age)
+            dept["oldest"] = age if dept["oldest"] is None else max(dept["oldest"], age)
+
+    for dept in departments.values():
+        dept["average_age"] = round(dept["age_total"] / dept["aged"], 1) if dept["aged"] else None
+        del dept["aged"], dept["age_total"]
+
+    return {
+        "generated_at": datetime.datetime.now().strftime("%Y-%m-%d %H:%M"),
+        "total": sum(by_status.values()),
+        "by_department_status": sorted(by_status.items()),
+        "age_distribution": [(band, bands[band]) for band in AGE_BANDS],
+        "departments": sorted(departments.items()),
+    }
+
+
+def get_summary(today=None):
+    """Cached compute_summary(); recomputed after the database or the date changed."""
+    key, version = data_version()
+    stamp = (version, today or datetime.date.today())
+    cached = _cache.get(key)
+    if cached and cached[0] == stamp:
+        return cached[1]
+    summary = compute_summary(stamp[1])
+    _cache[key] = (stamp, summary)
+    return summary
+
+
+def section_rows(summary):
+    """Yield (section title, header, rows) for each report section."""
+    yield ("Headcount by Department and Status", ("Department", "Status", "Headcount"),
+           ((d, s, n) for (d, s), n in summary["by_department_status"]))
+    yield ("Age Distribution", ("Age Band", "Headcount"), summary["age_distribution"])
+    yield ("Department Summary",
+           ("Department", "Headcount", "Active", "Average Age", "Youngest", "Oldest"),
+           ((name, d["headcount"], d["active"], d["average_age"], d["youngest"], d["oldest"])
+            for name, d in summary["departments"]))
+
+
+def iter_roster():
+    """Stream the live roster, name-sorted, in batches of ROSTER_BATCH rows."""
+    conn = None
+    try:
+        conn = database.get_connection()
+        cursor = conn.cursor()
+        cursor.execute('''
+            SELECT employee_id, name, gender, dob, department, position, status
+            FROM employees WHERE deleted_at IS NULL ORDER BY name ASC
+        ''')
+        while True:
+            rows = cursor.fetchmany(ROSTER_BATCH)
+            if not rows:
+                break
+            for row in rows:
+                yield row
+    finally:
+        if conn:
+            conn.close()
+
+
+ROSTER_HEADER = ("ID", "Name", "Gender", "DOB", "Department", "Position", "Status")
+
+
+def write_csv(fh, summary, roster):
+    writer = csv.writer(fh)
+    writer.writerow(("ESMS Report", summary["generated_at"], "Total", summary["total"]))
+    for title, header, rows in section_rows(summary):
+        writer.writerow(())
+        writer.writerow((title,))
+        writer.writerow(header)
+        for row in rows:
+            writer.writerow(("" if v is None else v for v in row))
+    if roster:
+        writer.writerow(())
+        writer.writerow(("Roster",))
+        writer.writerow(ROSTER_HEADER)
+        for row in iter_roster():
+            writer.writerow(row)
+
+
+def html_table(fh, title, header, rows):
+    fh.write("<h2>{}</h2>\n<table>\n<tr>".format(html.escape(title)))
+    fh.write("".join("<th>{}</th>".format(html.escape(h)) for h in header))
+    fh.write("</tr>\n")
+    for row in rows:
+        fh.write("<tr>" + "".join(
+            "<td>{}</td>".format(html.escape("" if v is None else str(v))) for v in row)
+            + "</tr>\n")
+    fh.write("</table>\n")
+
+
+def write_html(fh, summary, roster):
+    fh.write("<!DOCTYPE html>\n<html><head><meta charset=\"utf-8\">"
+             "<title>ESMS Report</title>\n<style>"
+             "body{font-family:Helvetica,Arial,sans-serif;color:#2c3e50;margin:16px}"
+             "table{border-collapse:collapse;margin-bottom:20px}"
+             "th,td{border:1px solid #ddd;padding:6px 10px;text-align:left}"
+             "th{background:#f4f7f6}</style></head><body>\n")
+    fh.write("<h1>ESMS Report</h1>\n<p>Generated {} &mdash; {} employees</p>\n".format(
+        html.escape(summary["generated_at"]), summary["total"]))
+    for title, header, rows in section_rows(summary):
+        html_table(fh, title, header, rows)
+    if roster:
+        html_table(fh, "Roster", ROSTER_HEADER, iter_roster())
+    fh.write("</body></html>\n")
+
+
+def generate_report(path=None, fmt="html", roster=False):
+    """
+    Write the report to `path` (default: reports/esms-report.<fmt>).
+
+    `fmt` is 'csv' or 'html'; `roster=True` appends every live employee.
+    If the database is unchanged since this same file was last written, the
+    file is left as is and returned immediately. Returns the path.
+    """
+    if fmt not in ("csv", "html"):
+        raise ValueError("Report format must be 'csv' or 'html'.")
+    if path is None:
+        os.makedirs(REPORT_DIR, exist_ok=True)
+        path = os.path.join(REPORT_DIR, "esms-report.{}".format(fmt))
+
+    key, version = data_version()
+    stamp = (version, datetime.date.today())
+    written_key = (key, os.path.abspath(path), fmt, roster)
+    previous = _written.get(written_key)
+    if previous and previous[0] == stamp and os.path.exists(path) \
+            and os.path.getmtime(path) == previous[1]:
+        return path
+
+    summary = get_summary(stamp[1])
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8", newline="") as fh:
+        if fmt == "csv":
+            write_csv(fh, summary, roster)
+        else:
+            write_html(fh, summary, roster)
+    os.replace(tmp_path, path)
+    _written[written_key] = (stamp, os.path.getmtime(path))
+    return path
@@ -0,0 +1,111 @@
+"""One database file per branch, with cross-branch search.
+
+Each branch (tenant) has its own ``branches/<name>.db`` with the full ESMS
+schema, so every file stays small and fast to query, back up and vacuum.
+The regular ``database`` functions are routed to a branch with
+``using_shard(name)`` (current thread only) or ``set_active_shard(name)``
+(whole app). ``search_all_shards`` fans a listing query out to every branch
+in parallel threads and merges the name-sorted results.
+"""
+import contextlib
+import functools
+import heapq
+import os
+import re
+from concurrent.futures import ThreadPoolExecutor
+
+import database
+import storage
+
+SHARD_DIR = os.path.join(database.BASE_DIR, "branches")
+SHARD_SUFFIX = ".db"
+MAX_WORKERS = 4
+
+_NAME_PATTERN = re.compile(r"^[A-Za-z0-9_-]+$")
+
+
+def shard_path(name, shard_dir=SHARD_DIR):
+    if not _NAME_PATTERN.match(name or ""):
+        raise ValueError("Branch name may only contain letters, digits, '-' and '_'.")
+    return os.path.join(shard_dir, name + SHARD_SUFFIX)
+
+
+def shard_names(shard_dir=SHARD_DIR):
+    """Return the existing branch names, sorted."""
+    if not os.path.isdir(shard_dir):
+        return []
+    return sorted(n[:-len(SHARD_SUFFIX)] for n in os.listdir(shard_dir)
+                  if n.endswith(SHARD_SUFFIX) and _NAME_PATTERN.match(n[:-len(SHARD_SUFFIX)]))
+
+
+def shard_backend(name, shard_dir=SHARD_DIR):
+    path = shard_path(name, shard_dir)
+    if not os.path.exists(path):
+        raise ValueError("Unknown branch: {}".format(name))
+    return storage.FileBackend(path)
+
+
+def create_shard(name, shard_dir=SHARD_DIR):
+    """Create (or migrate) the database file for branch `name`. Returns its path."""
+    path = shard_path(name, shard_dir)
+    os.makedirs(shard_dir, exist_ok=True)
+    with database.using_thread_backend(storage.FileBackend(path)):
+        database.init_db()
+    return path
+
+
+@contextlib.contextmanager
+def using_shard(name, shard_dir=SHARD_DIR):
+    """Route database calls on this thread to branch `name`."""
+    with database.using_thread_backend(shard_backend(name, shard_dir)) as backend:
+        yield backend
+
+
+def set_active_shard(name, shard_dir=SHARD_DIR):
+    """Route all database calls to branch `name` (None = back to employees.db)."""
+    database.set_backend(None if name is None else shard_backend(name, shard_dir))
+
+
+def query_shard(name, shard_dir=SHARD_DIR, **filters):
+    """Run database.list_employees() on one branch; rows are (branch, *LIST_COLUMNS)."""
+    with using_shard(name, shard_dir):
+        return [(name,) + row for row in database.list_employees(**filters)]
+
+
+def merge_order(sort_by, descending):
+    """
+    Sort key matching list_employees(): `sort_by` in either direction, then
+    name ascending. SQLite sorts NULL below any text, so None does here too.
+    """
+    columns = ((database.LIST_COLUMNS.index(sort_by) + 1, descending),
+               (database.LIST_COLUMNS.index("name") + 1, False))
+
+    def compare(a, b):
+        for index, reverse in columns:
+            x, y = (a[index] is not None, a[index]), (b[index] is not None, b[index])
+            if x != y:
+                return (1 if x > y else -1) * (-1 if reverse else 1)
+        return 0
+    return functools.cmp_to_key(compare)
+
+
+def search_all_shards(search=None, names=None, shard_dir=SHARD_DIR, sort_by="name",
+                      descending=False, **filters):
+    """
+    Search every branch (or just `names`) in parallel, merged in sort order.
+
+    Accepts the same sorting and filters as database.list_employees(). Each
+    branch already returns its rows sorted from its covering index, so merging
+    is a linear k-way merge rather than a re-sort.
+    """
+    if sort_by not in database.SORTABLE_COLUMNS:
+        raise ValueError("Cannot sort by '{}'.".format(sort_by))
+    names = shard_names(shard_dir) if names is None else list(names)
+    if not names:
+        return []
+    filters.update(search=search, sort_by=sort_by, descending=descending)
+    workers = min(MAX_WORKERS, len(names))
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        results = list(pool.map(lambda n: query_shard(n, shard_dir, **filters), names))
+    # Row layout: (branch, *LIST_COLUMNS); full ties keep branch order.
+    return list(heapq.merge(*results, key=merge_order(sort_by, descending)))
@@ -0,0 +1,163 @@
+"""Storage backends for the ESMS database.
+
+A backend only knows how to hand out sqlite3 connections; all SQL stays in
+``database.py``. Select one with ``database.set_backend()`` (or the
+``database.using_backend()`` context manager); by default the app uses a
+``FileBackend`` on ``database.DB_PATH``.
+
+``MemoryBackend`` keeps the whole database in RAM using a named shared-cache
+``:memory:`` database, so every connection handed out sees the same data.
+It can be loaded from a file and flushed back, which makes it suitable for
+tests, benchmarks and large batch jobs on slow storage.
+"""
+import itertools
+import sqlite3
+import time
+
+_memory_names = itertools.count(1)
+
+
+def retry_locked(timeout, func, *args):
+    """
+    Call `func(*args)`, retrying while it fails with SQLITE_LOCKED.
+
+    Shared-cache connections report table-lock conflicts as SQLITE_LOCKED
+    immediately instead of waiting out the busy timeout, so the wait is done
+    here, with a short back-off, for up to `timeout` seconds.
+    """
+    deadline = time.monotonic() + timeout
+    delay = 0.001
+    while True:
+        try:
+            return func(*args)
+        except sqlite3.OperationalError as e:
+            if "locked" not in str(e) or time.monotonic() >= deadline:
+                raise
+            time.sleep(delay)
+            delay = min(delay * 2, 0.05)
+
+
+class SharedCacheCursor(sqlite3.Cursor):
+    def execute(self, sql, parameters=()):
+        return retry_locked(self.connection.lock_timeout, super().execute, sql, parameters)
+
+    def executemany(self, sql, seq_of_parameters):
+        return retry_locked(self.connection.lock_timeout, super().executemany,
+                            sql, seq_of_parameters)
+
+
+class SharedCacheConnection(sqlite3.Connection):
+    """Connection whose statements and commits wait on shared-cache table locks."""
+
+    lock_timeout = 10
+
+    def cursor(self, factory=SharedCacheCursor):
+        return super().cursor(factory)
+
+    def execute(self, sql, parameters=()):
+        return self.cursor().execute(sql, parameters)
+
+    def executemany(self, sql, seq_of_parameters):
+        return self.cursor().executemany(sql, seq_of_parameters)
+
+    def commit(self):
+        return retry_locked(self.lock_timeout, super().commit)
+
+
+class FileBackend:
+    """A regular SQLite database file."""
+
+    def __init__(self, path, timeout=10):
+        self.path = path
+        self.timeout = timeout
+
+    def connect(self, **kwargs):
+        """Open a connection; `kwargs` are passed on to sqlite3.connect()."""
+        return sqlite3.connect(self.path, timeout=self.timeout, **kwargs)
+
+    def close(self):
+        pass
+
+    def __repr__(self):
+        return "FileBackend({!r})".format(self.path)
+
+
+class MemoryBackend:
+    """
+    A shared-cache in-memory database.
+
+    The data lives as long as the backend holds its own keeper connection
+    open, i.e. until ``close()``. Each instance gets a unique name unless one
+    is given, so separate backends never see each other's data.
+
+    Shared-cache connections lock per table and fail with SQLITE_LOCKED at
+    once on a conflict (the busy `timeout` does not apply). Connections from
+    ``connect()`` retry statements and commits for up to `timeout` seconds
+    instead. Rows already being fetched are not retried, and two connections
+    that each hold a lock the other needs will still time out, so keep write
+    transactions short when several threads share one backend.
+    """
+
+    def __init__(self, name=None, timeout=10):
+        if name is None:
+            name = "esms-mem-{}".format(next(_memory_names))
+        self.name = name
+        self.timeout = timeout
+        self.uri = "file:{}?mode=memory&cache=shared".format(name)
+        self._keeper = sqlite3.connect(self.uri, uri=True, check_same_thread=False)
+        self._close_callbacks = []
+
+    def connect(self, **kwargs):
+        """Open a connection; `kwargs` are passed on to sqlite3.connect()."""
+        if self._keeper is None:
+            raise RuntimeError("MemoryBackend '{}' is closed.".format(self.name))
+        kwargs.setdefault("factory", SharedCacheConnection)
+        conn = sqlite3.connect(self.uri, uri=True, timeout=self.timeout, **kwargs)
+        conn.lock_timeout = self.timeout
+        return conn
+
+    def load_from(self, path):
+        """Replace the in-memory contents with a copy of database file `path`."""
+        src = None
+        try:
+            src = sqlite3.connect("file:{}?mode=ro".format(path), uri=True)
+            src.backup(self._keeper)
+        finally:
+            if src:
+                src.close()
+
+    def flush_to(self, path):
+        """
+        Write the in-memory contents to database file `path`.
+
+        Goes through the online backup API, so it is a single transaction on
+        the target and safe even if the file is open elsewhere.
+        """
+        dst = None
+        try:
+            dst = sqlite3.connect(path, timeout=self.timeout)
+            self._keeper.backup(dst)
+        finally:
+            if dst:
+                dst.close()
+
+    def on_close(self, callback):
+        """
+        Call `callback()` when the backend is closed.
+
+        Anything holding its own long-lived connection (e.g. reports' watcher)
+        must close it here, or the shared-cache database outlives close().
+        """
+        self._close_callbacks.append(callback)
+
+    def close(self):
+        """Drop the in-memory database (unflushed changes are lost)."""
+        callbacks, self._close_callbacks = self._close_callbacks, []
+        for callback in callbacks:
+            callback()
+        if self._keeper is not None:
+            self._keeper.close()
+            self._keeper = None
+
+    def __repr__(self):
+        return "MemoryBackend({!r})".format(self.name)
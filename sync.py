@@ -0,0 +1,265 @@
+"""Incremental sync between ESMS databases.
+
+Every insert/update/delete on ``employees`` is journaled into ``change_log``
+by triggers (see ``database.create_schema``). Syncing only reads the journal
+past a per-peer watermark and ships the latest state of each changed record,
+so the cost scales with the number of changes, not the size of the roster.
+
+Conflicts are resolved last-writer-wins on ``updated_at`` (UTC, ms precision).
+Ties are broken deterministically so both sides converge on the same record.
+
+Two transports are supported:
+  - ``sync_databases(path_a, path_b)``: both files reachable (e.g. copied
+    from another phone into the same folder).
+  - ``export_drop`` / ``import_drop``: a small JSON delta file carried over
+    by any means (USB, shared folder, messaging app).
+"""
+import json
+import os
+
+import database
+import storage
+
+DROP_FORMAT = "esms-sync-1"
+
+
+def open_database(path=None):
+    """Open `path` (or the app database) with the sync schema in place."""
+    conn = database.get_connection() if path is None else storage.FileBackend(path).connect()
+    database.create_schema(conn)
+    conn.commit()
+    return conn
+
+
+def get_device_id(conn):
+    cursor = conn.cursor()
+    cursor.execute("SELECT value FROM sync_meta WHERE key = 'device_id'")
+    return cursor.fetchone()[0]
+
+
+def get_watermarks(conn, peer_id):
+    """Return (last_pulled, last_exported) change_ids recorded for `peer_id`."""
+    cursor = conn.cursor()
+    cursor.execute('SELECT last_pulled, last_exported FROM sync_peers WHERE peer_id = ?',
+                   (peer_id,))
+    row = cursor.fetchone()
+    return (row[0], row[1]) if row else (0, 0)
+
+
+def set_watermark(conn, peer_id, column, value):
+    cursor = conn.cursor()
+    cursor.execute('INSERT OR IGNORE INTO sync_peers (peer_id) VALUES (?)', (peer_id,))
+    cursor.execute('UPDATE sync_peers SET {} = ? WHERE peer_id = ?'.format(column),
+                   (value, peer_id))
+
+
+def collect_changes(conn, since=0):
+    """
+    Return (changes, high_water) for everything journaled after change_id `since`.
+
+    Multiple journal entries for the same record collapse to its latest state,
+    so a record edited 50 times is shipped once. NOT INDEXED keeps the planner
+    from scanning the whole journal through the uid index to satisfy GROUP BY;
+    it does a rowid range seek instead, touching only entries past `since`.
+    """
+    cols = ", ".join("e.{}".format(c) for c in database.SYNC_COLUMNS)
+    cursor = conn.cursor()
+    cursor.execute('''
+        SELECT c.change_id, c.uid, c.changed_at, e.uid, e.updated_at, {cols}
+        FROM (SELECT MAX(change_id) AS change_id
+              FROM change_log NOT INDEXED WHERE change_id > ?
+              GROUP BY uid) AS latest
+        JOIN change_log c ON c.change_id = latest.change_id
+        LEFT JOIN employees e ON e.uid = c.uid
+        ORDER BY c.change_id
+    '''.format(cols=cols), (since,))
+
+    changes = []
+    high_water = since
+    for row in cursor.fetchall():
+        change_id, uid, changed_at, live_uid, updated_at = row[:5]
+        high_water = max(high_water, change_id)
+        if live_uid is None:
+            changes.append({"uid": uid, "op": "delete", "updated_at": changed_at})
+        else:
+            changes.append({
+                "uid": uid, "op": "upsert", "updated_at": updated_at,
+                "data": dict(zip(database.SYNC_COLUMNS, row[5:])),
+            })
+    return changes, high_water
+
+
+def tie_key(change):
+    """Deterministic ordering for changes carrying the same timestamp."""
+    if change["op"] == "delete":
+        return (1, ())
+    return (0, tuple("" if change["data"].get(c) is None else str(change["data"][c])
+                     for c in database.SYNC_COLUMNS))
+
+
+def local_state(cursor, uid):
+    """Return the local version of `uid` in the same shape as a change, or None."""
+    cursor.execute('SELECT updated_at, {} FROM employees WHERE uid = ?'.format(
+        ", ".join(database.SYNC_COLUMNS)), (uid,))
+    row = cursor.fetchone()
+    if row:
+        return {"uid": uid, "op": "upsert", "updated_at": row[0],
+                "data": dict(zip(database.SYNC_COLUMNS, row[1:]))}
+    cursor.execute('''
+        SELECT changed_at FROM change_log
+        WHERE uid = ? AND op = 'D' ORDER BY change_id DESC LIMIT 1
+    ''', (uid,))
+    row = cursor.fetchone()
+    if row:
+        return {"uid": uid, "op": "delete", "updated_at": row[0]}
+    return None
+
+
+def apply_changes(conn, changes):
+    """
+    Apply remote `changes` to `conn` (no commit). Returns (applied, skipped).
+
+    A change wins when it is newer than the local version; equal timestamps
+    fall back to ``tie_key`` so both peers pick the same winner.
+    """
+    cursor = conn.cursor()
+    applied = skipped = 0
+    assignments = ", ".join("{} = ?".format(c) for c in database.SYNC_COLUMNS)
+    for change in changes:
+        local = local_state(cursor, change["uid"])
+        if local is not None:
+            if change["updated_at"] < local["updated_at"]:
+                skipped += 1
+                continue
+            if change["updated_at"] == local["updated_at"] and \
+                    tie_key(change) <= tie_key(local):
+                skipped += 1
+                continue
+        elif change["op"] == "delete":
+            # Never seen here; nothing to remove.
+            skipped += 1
+            continue
+
+        if change["op"] == "delete":
+            cursor.execute('DELETE FROM employees WHERE uid = ?', (change["uid"],))
+            # Keep the originating delete time so later comparisons stay fair.
+            cursor.execute('''
+                UPDATE change_log SET changed_at = ?
+                WHERE change_id = (SELECT MAX(change_id) FROM change_log WHERE uid = ?)
+            ''', (change["updated_at"], change["uid"]))
+        elif local is not None and local["op"] == "upsert":
+            values = [change["data"].get(c) for c in database.SYNC_COLUMNS]
+            cursor.execute(
+                'UPDATE employees SET {}, updated_at = ? WHERE uid = ?'.format(assignments),
+                values + [change["updated_at"], change["uid"]])
+        else:
+            values = [change["data"].get(c) for c in database.SYNC_COLUMNS]
+            cursor.execute('''
+                INSERT INTO employees ({cols}, uid, updated_at)
+                VALUES ({marks}, ?, ?)
+            '''.format(cols=", ".join(database.SYNC_COLUMNS),
+                       marks=", ".join("?" for _ in database.SYNC_COLUMNS)),
+                values + [change["uid"], change["updated_at"]])
+        applied += 1
+    return applied, skipped
+
+
+def pull(local_conn, remote_conn):
+    """Bring `local_conn` up to date with `remote_conn`. Returns (applied, skipped)."""
+    remote_id = get_device_id(remote_conn)
+    last_pulled = get_watermarks(local_conn, remote_id)[0]
+    changes, high_water = collect_changes(remote_conn, last_pulled)
+    try:
+        result = apply_changes(local_conn, changes)
+        set_watermark(local_conn, remote_id, "last_pulled", high_water)
+        local_conn.commit()
+    except Exception:
+        local_conn.rollback()
+        raise
+    return result
+
+
+def sync_databases(path_a, path_b=None):
+    """
+    Two-way sync of two database files (`path_b` defaults to the app database).
+
+    Returns {"a": (applied, skipped), "b": (applied, skipped)}.
+    """
+    conn_a = conn_b = None
+    try:
+        conn_a = open_database(path_a)
+        conn_b = open_database(path_b)
+        if get_device_id(conn_a) == get_device_id(conn_b):
+            raise ValueError("Both databases have the same device id "
+                             "(one is a plain copy of the other).")
+        into_a = pull(conn_a, conn_b)
+        into_b = pull(conn_b, conn_a)
+        return {"a": into_a, "b": into_b}
+    finally:
+        if conn_a:
+            conn_a.close()
+        if conn_b:
+            conn_b.close()
+
+
+def export_drop(drop_path, peer_id="drop", full=False, path=None):
+    """
+    Write the changes not yet exported to `peer_id` into a JSON drop file.
+
+    Pass ``full=True`` to re-export from the start of the journal (e.g. for
+    a new device, or after a drop file was lost). Returns the change count.
+    """
+    conn = None
+    try:
+        conn = open_database(path)
+        since = 0 if full else get_watermarks(conn, peer_id)[1]
+        changes, high_water = collect_changes(conn, since)
+        payload = {
+            "format": DROP_FORMAT,
+            "device_id": get_device_id(conn),
+            "since": since,
+            "high_water": high_water,
+            "changes": changes,
+        }
+        tmp_path = drop_path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as fh:
+            json.dump(payload, fh)
+        os.replace(tmp_path, drop_path)
+        set_watermark(conn, peer_id, "last_exported", high_water)
+        conn.commit()
+        return len(changes)
+    finally:
+        if conn:
+            conn.close()
+
+
+def import_drop(drop_path, path=None):
+    """Apply a drop file written by ``export_drop``. Returns (applied, skipped)."""
+    with open(drop_path, "r", encoding="utf-8") as fh:
+        payload = json.load(fh)
+    if payload.get("format") != DROP_FORMAT:
+        raise ValueError("Not an ESMS sync file: {}".format(drop_path))
+
+    conn = None
+    try:
+        conn = open_database(path)
+        sender = payload["device_id"]
+        if sender == get_device_id(conn):
+            raise ValueError("This drop file was exported from this database.")
+        last_pulled = get_watermarks(conn, sender)[0]
+        if payload["high_water"] <= last_pulled:
+            return 0, 0
+        if payload["since"] > last_pulled:
+            raise ValueError("Drop file is out of sequence (an earlier drop was missed).\n"
+                             "Re-export on the other device with full=True.")
+        try:
+            result = apply_changes(conn, payload["changes"])
+            set_watermark(conn, sender, "last_pulled", payload["high_water"])
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        return result
+    finally:
+        if conn:
+            conn.close()